@@ -4,20 +4,68 @@ Error Simulation Testing Script for AI Voice Assistant
 This script helps test various error scenarios to validate error handling robustness.
 """
 
-import os
+import asyncio
+import struct
 import time
-import requests
+import httpx
 import json
+import orjson
 from pathlib import Path
-import tempfile
-import wave
-import numpy as np
+from functools import lru_cache
 from typing import Dict, Any, Optional
 
+def _wav_header(num_samples: int, sample_rate: int) -> bytes:
+    """Build the 44-byte RIFF header for mono 16-bit PCM audio"""
+    data_size = num_samples * 2  # 2 bytes per sample
+    return (
+        b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+@lru_cache(maxsize=4)
+def _one_second_tone(sample_rate: int):
+    """Compute one second of a 440 Hz tone as 16-bit PCM samples, shared by every clip length"""
+    # Imported here so commands that never build audio (e.g. --scenarios) skip loading numpy
+    import numpy as np
+    
+    # Generate a simple 440 Hz sine wave in float32 from a fixed phase step.
+    # One second holds a whole number of cycles, so longer clips repeat it exactly.
+    phase_step = np.float32(2 * np.pi * 440 / sample_rate)
+    one_second = np.arange(sample_rate, dtype=np.float32)
+    np.multiply(one_second, phase_step, out=one_second)
+    np.sin(one_second, out=one_second)
+    
+    # Convert to 16-bit PCM
+    np.multiply(one_second, 32767, out=one_second)
+    tone = one_second.astype(np.int16)
+    tone.flags.writeable = False
+    return tone
+
+@lru_cache(maxsize=16)
+def _make_wav(duration: float, sample_rate: int) -> bytes:
+    """Build a mono 16-bit WAV clip of a 440 Hz tone, cached per duration and rate"""
+    import numpy as np
+    
+    # Every duration slices or repeats the same precomputed second of samples
+    num_samples = int(sample_rate * duration)
+    audio_data = np.resize(_one_second_tone(sample_rate), num_samples)
+    
+    # Prefix the samples with a header whose sizes are known up front
+    return _wav_header(num_samples, sample_rate) + audio_data.tobytes()
+
 class ErrorSimulationTester:
+    # Number of simultaneous uploads made by the concurrent-session test
+    CONCURRENT_REQUESTS = 3
+    # Payload that is not audio, for the corrupted-upload test
+    CORRUPTED_AUDIO = b"This is not audio data, just random bytes for testing error handling"
+    # Very long text that might cause TTS issues
+    LONG_TTS_TEXT = "This is a very long text message. " * 100
+
     def __init__(self, base_url: str = "http://localhost:8000"):
         self.base_url = base_url
         self.test_results = []
+        self.client: Optional[httpx.AsyncClient] = None
         
     def log_test_result(self, test_name: str, success: bool, response_data: Dict[Any, Any], error_msg: str = ""):
         """Log test results for analysis"""
@@ -34,57 +82,40 @@ class ErrorSimulationTester:
         print(f"{status} {test_name}")
         if error_msg:
             print(f"   Error: {error_msg}")
-        print(f"   Response: {json.dumps(response_data, indent=2)[:200]}...")
+        print(f"   Response: {json.dumps(response_data, separators=(',', ':'))[:200]}...")
         print("-" * 50)
 
+    def parse_response(self, response: httpx.Response) -> Dict[Any, Any]:
+        """Decode a JSON response body, keeping a short raw excerpt for non-JSON error pages"""
+        if response.headers.get("content-type", "").startswith("application/json"):
+            return response.json()
+        return {"status_code": response.status_code, "raw": response.text[:512]}
+
     def create_test_audio(self, duration: float = 2.0, sample_rate: int = 44100) -> bytes:
         """Create a simple test audio file in memory"""
         try:
-            # Generate a simple sine wave
-            t = np.linspace(0, duration, int(sample_rate * duration))
-            audio_data = np.sin(2 * np.pi * 440 * t)  # 440 Hz sine wave
-            
-            # Convert to 16-bit PCM
-            audio_data = (audio_data * 32767).astype(np.int16)
-            
-            # Create WAV file in memory
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                with wave.open(tmp_file.name, 'wb') as wav_file:
-                    wav_file.setnchannels(1)  # Mono
-                    wav_file.setsampwidth(2)  # 2 bytes per sample
-                    wav_file.setframerate(sample_rate)
-                    wav_file.writeframes(audio_data.tobytes())
-                
-                # Read the file back as bytes
-                tmp_file.seek(0)
-                with open(tmp_file.name, 'rb') as f:
-                    audio_bytes = f.read()
-                
-                # Clean up
-                os.unlink(tmp_file.name)
-                return audio_bytes
-                
+            return _make_wav(duration, sample_rate)
         except Exception as e:
             print(f"Failed to create test audio: {e}")
             return b""
 
     def create_corrupted_audio(self) -> bytes:
         """Create corrupted audio data for testing"""
-        return b"This is not audio data, just random bytes for testing error handling"
+        return self.CORRUPTED_AUDIO
 
-    def test_health_check(self):
+    async def test_health_check(self):
         """Test the health check endpoint"""
         try:
-            response = requests.get(f"{self.base_url}/health", timeout=10)
+            response = await self.client.get("/health", timeout=10)
             self.log_test_result(
                 "Health Check", 
                 response.status_code == 200,
-                response.json() if response.status_code == 200 else {"status_code": response.status_code}
+                self.parse_response(response) if response.status_code == 200 else {"status_code": response.status_code}
             )
         except Exception as e:
             self.log_test_result("Health Check", False, {}, str(e))
 
-    def test_missing_api_keys(self):
+    async def test_missing_api_keys(self):
         """Test behavior when API keys are missing (simulated by invalid keys)"""
         # This test assumes you've temporarily removed or invalidated API keys
         print("⚠️  To test this scenario, temporarily comment out API keys in your .env file")
@@ -96,10 +127,10 @@ class ErrorSimulationTester:
             
         try:
             files = {'audio_file': ('test.wav', audio_data, 'audio/wav')}
-            response = requests.post(f"{self.base_url}/agent/chat/test_session", files=files, timeout=30)
+            response = await self.client.post("/agent/chat/test_session", files=files)
             
             # We expect this to fail gracefully with proper error messages
-            response_data = response.json()
+            response_data = self.parse_response(response)
             
             # Check if response contains fallback messages
             has_fallback = (
@@ -117,15 +148,15 @@ class ErrorSimulationTester:
         except Exception as e:
             self.log_test_result("Missing API Keys Test", False, {}, str(e))
 
-    def test_corrupted_audio_input(self):
+    async def test_corrupted_audio_input(self):
         """Test handling of corrupted audio data"""
         corrupted_audio = self.create_corrupted_audio()
         
         try:
             files = {'audio_file': ('corrupted.wav', corrupted_audio, 'audio/wav')}
-            response = requests.post(f"{self.base_url}/agent/chat/test_session_corrupted", files=files, timeout=30)
+            response = await self.client.post("/agent/chat/test_session_corrupted", files=files)
             
-            response_data = response.json()
+            response_data = self.parse_response(response)
             
             # Should handle gracefully with appropriate error message
             is_handled_gracefully = (
@@ -142,16 +173,16 @@ class ErrorSimulationTester:
         except Exception as e:
             self.log_test_result("Corrupted Audio Test", False, {}, str(e))
 
-    def test_empty_audio_input(self):
+    async def test_empty_audio_input(self):
         """Test handling of empty/silent audio"""
         try:
             # Create very short or silent audio
             silent_audio = self.create_test_audio(duration=0.1)  # Very short
             
             files = {'audio_file': ('silent.wav', silent_audio, 'audio/wav')}
-            response = requests.post(f"{self.base_url}/agent/chat/test_session_empty", files=files, timeout=30)
+            response = await self.client.post("/agent/chat/test_session_empty", files=files)
             
-            response_data = response.json()
+            response_data = self.parse_response(response)
             
             # Should detect no speech and provide helpful message
             is_handled_properly = (
@@ -169,7 +200,7 @@ class ErrorSimulationTester:
         except Exception as e:
             self.log_test_result("Empty Audio Test", False, {}, str(e))
 
-    def test_network_timeout(self):
+    async def test_network_timeout(self):
         """Test network timeout handling"""
         audio_data = self.create_test_audio()
         if not audio_data:
@@ -178,8 +209,8 @@ class ErrorSimulationTester:
         try:
             files = {'audio_file': ('test.wav', audio_data, 'audio/wav')}
             # Use very short timeout to simulate network issues
-            response = requests.post(
-                f"{self.base_url}/agent/chat/test_session_timeout", 
+            response = await self.client.post(
+                "/agent/chat/test_session_timeout", 
                 files=files, 
                 timeout=0.1  # Very short timeout
             )
@@ -187,21 +218,21 @@ class ErrorSimulationTester:
             # This should timeout
             self.log_test_result("Network Timeout Test", False, {}, "Expected timeout did not occur")
             
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             self.log_test_result("Network Timeout Handling", True, {"timeout_handled": True})
         except Exception as e:
             self.log_test_result("Network Timeout Test", False, {}, str(e))
 
-    def test_large_audio_file(self):
+    async def test_large_audio_file(self):
         """Test handling of excessively large audio files"""
         try:
             # Create a longer audio file (might hit size limits)
             large_audio = self.create_test_audio(duration=30.0)  # 30 seconds
             
             files = {'audio_file': ('large.wav', large_audio, 'audio/wav')}
-            response = requests.post(f"{self.base_url}/agent/chat/test_session_large", files=files, timeout=60)
+            response = await self.client.post("/agent/chat/test_session_large", files=files, timeout=60)
             
-            response_data = response.json()
+            response_data = self.parse_response(response)
             
             # Should either process successfully or fail gracefully
             self.log_test_result(
@@ -213,13 +244,13 @@ class ErrorSimulationTester:
         except Exception as e:
             self.log_test_result("Large Audio File Test", False, {}, str(e))
 
-    def test_invalid_session_operations(self):
+    async def test_invalid_session_operations(self):
         """Test session management error handling"""
         try:
             # Test getting history for non-existent session
-            response = requests.get(f"{self.base_url}/agent/history/non_existent_session_12345")
+            response = await self.client.get("/agent/history/non_existent_session_12345")
             
-            response_data = response.json()
+            response_data = self.parse_response(response)
             
             # Should return new session response
             is_handled = (
@@ -236,19 +267,15 @@ class ErrorSimulationTester:
         except Exception as e:
             self.log_test_result("Invalid Session Test", False, {}, str(e))
 
-    def test_text_to_speech_fallback(self):
+    async def test_text_to_speech_fallback(self):
         """Test TTS service fallback behavior"""
         try:
-            # Test with a very long text that might cause TTS issues
-            long_text = "This is a very long text message. " * 100  # Very long text
-            
-            response = requests.post(
-                f"{self.base_url}/generate-audio",
-                json={"text": long_text, "voice_id": "en-US-natalie"},
-                timeout=30
+            response = await self.client.post(
+                "/generate-audio",
+                json={"text": self.LONG_TTS_TEXT, "voice_id": "en-US-natalie"}
             )
             
-            response_data = response.json()
+            response_data = self.parse_response(response)
             
             # Should either succeed or provide graceful fallback
             is_handled = (
@@ -265,41 +292,65 @@ class ErrorSimulationTester:
         except Exception as e:
             self.log_test_result("TTS Fallback Test", False, {}, str(e))
 
-    def test_concurrent_requests(self):
+    async def test_concurrent_requests(self):
         """Test handling of concurrent requests to the same session"""
-        import threading
-        import concurrent.futures
-        
         audio_data = self.create_test_audio()
         if not audio_data:
             return
             
-        def make_request(session_suffix):
+        async def make_request(session_suffix):
             try:
                 files = {'audio_file': (f'test_{session_suffix}.wav', audio_data, 'audio/wav')}
-                response = requests.post(
-                    f"{self.base_url}/agent/chat/concurrent_test_session", 
-                    files=files, 
-                    timeout=30
+                response = await self.client.post(
+                    "/agent/chat/concurrent_test_session", 
+                    files=files
                 )
-                return response.status_code, response.json()
+                return response.status_code, self.parse_response(response)
             except Exception as e:
                 return 500, {"error": str(e)}
         
         # Make multiple concurrent requests
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-            futures = [executor.submit(make_request, i) for i in range(3)]
-            results = [future.result() for future in concurrent.futures.as_completed(futures)]
+        results = await asyncio.gather(*(make_request(i) for i in range(self.CONCURRENT_REQUESTS)))
         
         successful_requests = sum(1 for status, _ in results if status in [200, 206])
         
         self.log_test_result(
             "Concurrent Requests Handling",
             successful_requests >= 1,  # At least one should succeed
-            {"successful_requests": successful_requests, "total_requests": 3}
+            {"successful_requests": successful_requests, "total_requests": self.CONCURRENT_REQUESTS}
         )
 
-    def run_all_tests(self):
+    async def check_server(self) -> bool:
+        """Check that the API server is reachable on the pooled client"""
+        try:
+            await self.client.get("/health", timeout=5)
+            print(f"✅ Server is running at {self.base_url}")
+            return True
+        except Exception:
+            print(f"❌ Server not reachable at {self.base_url}")
+            print("Please start your FastAPI server first:")
+            print("   python main.py")
+            return False
+
+    async def run_tests(self, tests) -> bool:
+        """Run the given tests concurrently over one pooled HTTP client, returning False if the server is down"""
+        async def run_test(test):
+            try:
+                await test()
+            except Exception as e:
+                print(f"❌ Test {test.__name__} crashed: {e}")
+        
+        # Keep a pooled connection alive for every request that can be in flight at once
+        limits = httpx.Limits(max_keepalive_connections=len(tests) + self.CONCURRENT_REQUESTS)
+        
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=30, limits=limits) as self.client:
+            server_up = await self.check_server()
+            if server_up:
+                await asyncio.gather(*(run_test(test) for test in tests))
+        self.client = None
+        return server_up
+
+    async def run_all_tests(self):
         """Run all error simulation tests"""
         print("🧪 Starting Error Simulation Tests")
         print("=" * 60)
@@ -316,14 +367,8 @@ class ErrorSimulationTester:
             # self.test_missing_api_keys,  # Uncomment to test API key scenarios
         ]
         
-        for test in tests:
-            try:
-                test()
-                time.sleep(1)  # Brief pause between tests
-            except Exception as e:
-                print(f"❌ Test {test.__name__} crashed: {e}")
-        
-        self.generate_test_report()
+        if await self.run_tests(tests):
+            self.generate_test_report()
 
     def generate_test_report(self):
         """Generate a comprehensive test report"""
@@ -350,17 +395,18 @@ class ErrorSimulationTester:
         
         # Generate detailed JSON report
         report_file = f"error_handling_test_report_{int(time.time())}.json"
-        with open(report_file, 'w') as f:
-            json.dump({
-                "summary": {
-                    "total_tests": total_tests,
-                    "passed_tests": passed_tests,
-                    "failed_tests": failed_tests,
-                    "success_rate": (passed_tests/total_tests)*100
-                },
-                "test_results": self.test_results,
-                "timestamp": time.time()
-            }, f, indent=2)
+        report = {
+            "summary": {
+                "total_tests": total_tests,
+                "passed_tests": passed_tests,
+                "failed_tests": failed_tests,
+                "success_rate": (passed_tests/total_tests)*100
+            },
+            "test_results": self.test_results,
+            "timestamp": time.time()
+        }
+        with open(report_file, 'wb') as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
         
         print(f"\n📄 Detailed report saved to: {report_file}")
         
@@ -448,7 +494,19 @@ def main():
     """Main function to run error simulation tests"""
     import argparse
     
-    parser = argparse.ArgumentParser(description="AI Voice Assistant Error Handling Tester")
+    parser = argparse.ArgumentParser(
+        description="AI Voice Assistant Error Handling Tester",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=(
+            "Usage examples:\n"
+            "  python error_simulation.py                    # Run all tests\n"
+            "  python error_simulation.py --scenarios        # Show simulation scenarios\n"
+            "  python error_simulation.py --test basic       # Run basic tests only\n"
+            "  python error_simulation.py --url http://localhost:8080  # Custom URL\n"
+            "\n"
+            "Make sure your FastAPI server is running before executing tests!"
+        )
+    )
     parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the API server")
     parser.add_argument("--scenarios", action="store_true", help="Show error simulation scenarios")
     parser.add_argument("--test", default="all", choices=["all", "basic", "network", "audio"], 
@@ -464,35 +522,28 @@ def main():
         ErrorScenarioGenerator.simulate_network_issues()
         return
     
-    # Check if server is running
-    try:
-        response = requests.get(f"{args.url}/health", timeout=5)
-        print(f"✅ Server is running at {args.url}")
-    except:
-        print(f"❌ Server not reachable at {args.url}")
-        print("Please start your FastAPI server first:")
-        print("   python main.py")
-        return
-    
-    # Run tests
+    # Run tests; the server check shares the tests' pooled connection
     tester = ErrorSimulationTester(args.url)
     
     if args.test == "all":
-        tester.run_all_tests()
+        asyncio.run(tester.run_all_tests())
     elif args.test == "basic":
-        tester.test_health_check()
-        tester.test_invalid_session_operations()
-        tester.test_text_to_speech_fallback()
+        asyncio.run(tester.run_tests([
+            tester.test_health_check,
+            tester.test_invalid_session_operations,
+            tester.test_text_to_speech_fallback,
+        ]))
     elif args.test == "network":
-        tester.test_network_timeout()
-        tester.test_concurrent_requests()
+        asyncio.run(tester.run_tests([
+            tester.test_network_timeout,
+            tester.test_concurrent_requests,
+        ]))
     elif args.test == "audio":
-        tester.test_corrupted_audio_input()
-        tester.test_empty_audio_input()
-        tester.test_large_audio_file()
-
-if __name__ == "__main__":
-    main()
+        asyncio.run(tester.run_tests([
+            tester.test_corrupted_audio_input,
+            tester.test_empty_audio_input,
+            tester.test_large_audio_file,
+        ]))
 
 # Additional utility functions for manual testing
 
@@ -560,15 +611,4 @@ def stress_test_endpoints():
         print()
 
 if __name__ == "__main__":
-    # If running directly, provide usage examples
-    print("🧪 AI Voice Assistant Error Handling Test Suite")
-    print("=" * 50)
-    print("Usage examples:")
-    print("  python error_simulation.py                    # Run all tests")
-    print("  python error_simulation.py --scenarios        # Show simulation scenarios")
-    print("  python error_simulation.py --test basic       # Run basic tests only")
-    print("  python error_simulation.py --url http://localhost:8080  # Custom URL")
-    print()
-    print("Make sure your FastAPI server is running before executing tests!")
-    
-    main()
\ No newline at end of file
+    main()
@@ -1,31 +1,54 @@
+import asyncio
 import os
-import shutil
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, HTTPException, UploadFile, File
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from pathlib import Path
-from datetime import datetime
+from pydantic import BaseModel, Field
 import logging
-from typing import Dict, List, Optional
-from services.stt_service import transcribe_audio
+import logging.handlers
+import queue
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+from services.stt_service import close_stt_pool, transcribe_audio
 from services.llm_service import generate_llm_response
-from services.tts_service import generate_tts
+from services.tts_service import close_tts_client, generate_tts, warm_up_tts_connection
 from services.fallback_service import generate_fallback_audio
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
 # Load environment variables
 load_dotenv()
+
+# Configure logging; set LOG_LEVEL=WARNING in production to skip per-request info logs.
+# Records are queued and written to stderr by a listener thread, keeping stream I/O off the event loop
+log_queue = queue.SimpleQueue()
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=[logging.handlers.QueueHandler(log_queue)])
+log_listener.start()
+logger = logging.getLogger(__name__)
+
 murf_api_key = os.getenv("MURF_API_KEY")
 assemblyai_api_key = os.getenv("ASSEMBLYAI_API_KEY")
 
+# Speak STT/LLM error messages through Murf; off by default so failures never spend extra TTS calls
+ENABLE_FALLBACK_TTS = os.getenv("ENABLE_FALLBACK_TTS", "false").lower() in ("1", "true", "yes")
+
+# Reuse Gemini replies for byte-identical prompts; disable to always get a fresh generation
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release pooled upstream connections and threads, and flush queued log records on shutdown"""
+    yield
+    await close_tts_client()
+    close_stt_pool()
+    log_listener.stop()
+
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -33,17 +56,24 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Initialize Jinja2 templates
 templates = Jinja2Templates(directory="templates")
 
-# Define the upload folder
-UPLOAD_FOLDER = Path("uploads")
-UPLOAD_FOLDER.mkdir(exist_ok=True)
+# Audio uploads accepted by the chat endpoint; anything else is rejected before calling AssemblyAI
+ALLOWED_AUDIO_TYPES = {"audio/wav", "audio/x-wav", "audio/wave", "audio/mpeg", "audio/mp4", "audio/webm", "audio/ogg"}
+MIN_AUDIO_BYTES = 1000
+MAX_AUDIO_BYTES = 50 * 1024 * 1024
+
+# Maximum number of chat sessions kept in memory
+MAX_CHAT_SESSIONS = 10_000
 
-# In-memory chat history storage
-chat_histories: Dict[str, List[Dict[str, str]]] = {}
+# Messages kept per session; the LLM prompt only ever uses the most recent ones
+MAX_HISTORY_MESSAGES = 12
+
+# In-memory chat history storage, ordered from least to most recently used
+chat_histories: "OrderedDict[str, Deque[Dict[str, str]]]" = OrderedDict()
 
 # Pydantic models for request/response bodies
 class TTSRequest(BaseModel):
-    text: str = "The quick brown fox jumps over the lazy dog"
-    voice_id: str = "en-US-natalie"
+    text: str = Field(default="The quick brown fox jumps over the lazy dog", max_length=3000)
+    voice_id: str = Field(default="en-US-natalie", pattern=r"^[A-Za-z0-9-]+$")
 
 class ChatResponse(BaseModel):
     user_message: str
@@ -58,77 +88,134 @@ class ErrorResponse(BaseModel):
     audio_url: Optional[str] = None
     status: str = "error"
 
+# Upload rejection responses by error type; their bodies never change, so they are serialized once at startup
+UPLOAD_ERRORS = {
+    error_type: (status_code, ErrorResponse(error="Invalid audio upload", error_type=error_type, fallback_message=message).model_dump_json())
+    for error_type, status_code, message in [
+        ("unsupported_audio", 415, "That audio format isn't supported. Please record again."),
+        ("audio_too_short", 400, "Recording too short. Please speak longer and try again."),
+        ("audio_too_large", 413, "That recording is too long. Please keep it shorter and try again."),
+    ]
+}
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-flight
+background_tasks = set()
+
 # Helper functions
-def get_or_create_session(session_id: str) -> List[Dict[str, str]]:
-    """Get existing chat history or create new session"""
-    if session_id not in chat_histories:
-        chat_histories[session_id] = []
-        logger.info(f"Created new chat session: {session_id}")
+def run_in_background(coro) -> asyncio.Task:
+    """Schedule a coroutine without awaiting it, keeping the task alive until it finishes"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def get_or_create_session(session_id: str) -> Deque[Dict[str, str]]:
+    """Get existing chat history or create new session, evicting the least recently used one when full"""
+    if session_id in chat_histories:
+        chat_histories.move_to_end(session_id)
+    else:
+        chat_histories[session_id] = deque(maxlen=MAX_HISTORY_MESSAGES)
+        logger.info("Created new chat session: %s", session_id)
+        if len(chat_histories) > MAX_CHAT_SESSIONS:
+            evicted_session_id, _ = chat_histories.popitem(last=False)
+            logger.info("Evicted least recently used chat session: %s", evicted_session_id)
     return chat_histories[session_id]
 
+def check_audio_upload(audio_file: UploadFile) -> Optional[Response]:
+    """Return an error response for uploads that cannot be transcribed, or None if the upload looks usable"""
+    content_type = (audio_file.content_type or "").split(";")[0].strip().lower()
+    if content_type not in ALLOWED_AUDIO_TYPES:
+        error_type = "unsupported_audio"
+    elif audio_file.size is not None and audio_file.size < MIN_AUDIO_BYTES:
+        error_type = "audio_too_short"
+    elif audio_file.size is not None and audio_file.size > MAX_AUDIO_BYTES:
+        error_type = "audio_too_large"
+    else:
+        return None
+
+    logger.warning("Rejected audio upload (%s, %s bytes): %s", content_type, audio_file.size, error_type)
+    status_code, body = UPLOAD_ERRORS[error_type]
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
 def add_message_to_history(session_id: str, role: str, content: str):
     """Add a message to the chat history"""
     try:
-        if session_id not in chat_histories:
-            chat_histories[session_id] = []
-        chat_histories[session_id].append({"role": role, "content": content})
-        logger.info(f"Added {role} message to session {session_id}: {content[:50]}...")
+        get_or_create_session(session_id).append({"role": role, "content": content})
+        logger.debug("Added %s message to session %s: %.50s...", role, session_id, content)
     except Exception as e:
-        logger.error(f"Failed to add message to history: {e}")
+        logger.error("Failed to add message to history: %s", e)
 
 # Routes
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
-@app.post("/agent/chat/{session_id}", response_class=JSONResponse)
+@app.post("/agent/chat/{session_id}")
 async def chat_with_agent(session_id: str, audio_file: UploadFile = File(...)):
+    # Reject unusable uploads before spending any upstream API calls
+    upload_error = check_audio_upload(audio_file)
+    if upload_error:
+        return upload_error
+
+    # Open the Murf connection while STT and the LLM run, keeping its handshake off the TTS step
+    if murf_api_key:
+        run_in_background(warm_up_tts_connection())
+
     # 1. Transcribe audio
-    success, transcript_text, stt_error = transcribe_audio(audio_file, assemblyai_api_key)
+    success, transcript_text, stt_error = await transcribe_audio(audio_file.file, assemblyai_api_key)
     if not success:
-        return JSONResponse(
+        fallback_audio = await generate_fallback_audio(transcript_text, "stt_error", murf_api_key) if ENABLE_FALLBACK_TTS else None
+        return ORJSONResponse(
             status_code=503,
             content=ErrorResponse(
                 error="Transcription failed",
                 error_type=stt_error,
                 fallback_message=transcript_text,
-                audio_url=generate_fallback_audio(transcript_text, "stt_error")
-            ).dict()
+                audio_url=fallback_audio
+            ).model_dump()
         )
 
     # 2. Get LLM response
     chat_history = get_or_create_session(session_id)
+    success, ai_response, llm_error = await generate_llm_response(chat_history, transcript_text, use_cache=LLM_CACHE_ENABLED)
     add_message_to_history(session_id, "user", transcript_text)
-
-    success, ai_response, llm_error = generate_llm_response(chat_history, transcript_text)
     if not success:
-        return JSONResponse(
+        fallback_audio = await generate_fallback_audio(ai_response, "llm_error", murf_api_key) if ENABLE_FALLBACK_TTS else None
+        return ORJSONResponse(
             status_code=503,
             content=ErrorResponse(
                 error="LLM generation failed",
                 error_type=llm_error,
                 fallback_message=ai_response,
-                audio_url=generate_fallback_audio(ai_response, "llm_error")
-            ).dict()
+                audio_url=fallback_audio
+            ).model_dump()
         )
     add_message_to_history(session_id, "assistant", ai_response)
 
     # 3. Generate TTS audio
-    success, audio_url, tts_error = generate_tts(ai_response, murf_api_key)
+    success, audio_url, tts_error = await generate_tts(ai_response, murf_api_key)
     if not success:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=206, # Partial Content
             content=ErrorResponse(
                 error="TTS generation failed",
                 error_type=tts_error,
                 fallback_message="Voice response unavailable, but here's the text answer.",
                 audio_url=audio_url
-            ).dict()
+            ).model_dump()
         )
 
-    return ChatResponse(
-        user_message=transcript_text,
-        ai_response=ai_response,
-        audio_url=audio_url,
-        status="success"
-    ).dict()
\ No newline at end of file
+    return ORJSONResponse(
+        content=ChatResponse(
+            user_message=transcript_text,
+            ai_response=ai_response,
+            audio_url=audio_url,
+            status="success"
+        ).model_dump()
+    )
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # Single worker: chat history lives in this process. uvloop and httptools are picked up automatically when installed
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")), loop="auto", http="auto")
@@ -1,16 +1,18 @@
 import logging
 from typing import Optional
+from services.tts_service import generate_tts
 
 logger = logging.getLogger(__name__)
 
-def generate_fallback_audio(text: str, error_type: str = "general_error") -> Optional[str]:
-    """Generate fallback audio response using a backup TTS service or return None"""
+async def generate_fallback_audio(text: str, error_type: str = "general_error", api_key: Optional[str] = None) -> Optional[str]:
+    """Speak a fallback message through the cached Murf path, or return None if that fails too"""
     try:
-        # In a real implementation, you might use a different TTS service as backup
-        # For now, we'll just log and return None
-        logger.info(f"Fallback audio generation requested for: {text}")
-        # Could implement backup TTS service here (e.g., gTTS, pyttsx3, etc.)
+        # A single attempt: the user is already waiting on a failed request
+        success, audio_url, _ = await generate_tts(text, api_key, max_retries=0)
+        if success:
+            return audio_url
+        logger.warning("Fallback audio unavailable for %s", error_type)
         return None
     except Exception as e:
-        logger.error(f"Fallback audio generation failed: {e}")
-        return None
\ No newline at end of file
+        logger.error("Fallback audio generation failed: %s", e)
+        return None
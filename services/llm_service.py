@@ -1,7 +1,12 @@
+import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Tuple
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+from services.cache import TTLCache
+from services.reliability import Bulkhead, BulkheadFullError, CircuitBreaker, backoff_delay, is_retryable_status, retry_after_delay
 
 logger = logging.getLogger(__name__)
 
@@ -11,63 +16,141 @@ FALLBACK_RESPONSES = {
     "api_unavailable": "Some of my services are temporarily unavailable. I apologize for the inconvenience."
 }
 
-def format_chat_history_for_llm(chat_history: List[Dict[str, str]], new_message: str) -> str:
-    """Format chat history into a conversation prompt for the LLM"""
+# Reliability guards shared by every Gemini call in this process
+gemini_circuit = CircuitBreaker("gemini")
+gemini_bulkhead = Bulkhead("gemini")
+
+# Instructions sent as Gemini's system instruction, byte-identical on every turn
+SYSTEM_PROMPT = "You are a helpful AI assistant. Please provide clear, concise, and friendly responses. Keep your responses conversational and not too lengthy since they will be converted to speech."
+
+# Approximate token budget for replayed history, estimated at four characters per token
+HISTORY_TOKEN_BUDGET = 2048
+
+# Gemini conversation roles by chat history role; any role other than "user" was spoken by the assistant
+GEMINI_ROLES = {"user": "user", "assistant": "model"}
+
+# Gemini model used for every chat turn
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+
+# Generation settings shared by every call, keeping the system instruction as a stable prefix
+GENERATION_CONFIG = types.GenerateContentConfig(
+    system_instruction=SYSTEM_PROMPT,
+    thinking_config=types.ThinkingConfig(thinking_budget=0)
+)
+
+# Maximum number of responses kept for repeated prompts, and how long each is reused
+LLM_CACHE_SIZE = 1024
+LLM_CACHE_TTL = 600
+
+# Responses from earlier successful calls, keyed by a digest of model and conversation
+llm_cache = TTLCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+
+def llm_cache_key(contents: List[types.Content]) -> bytes:
+    """Build a compact cache key for a conversation sent to the configured model"""
+    digest = hashlib.blake2b(GEMINI_MODEL.encode(), digest_size=32)
+    for content in contents:
+        for part in content.parts:
+            digest.update(f"\0{content.role}\0{part.text}".encode())
+    return digest.digest()
+
+@lru_cache(maxsize=1)
+def get_genai_client() -> genai.Client:
+    """Create the Gemini client once and reuse its connection pool across requests"""
+    return genai.Client()
+
+def select_recent_messages(chat_history: Sequence[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Pick the most recent messages whose estimated token count fits the history budget"""
+    selected = []
+    tokens = 0
+    for message in reversed(chat_history):
+        tokens += len(message["content"]) // 4 + 1
+        if tokens > HISTORY_TOKEN_BUDGET:
+            break
+        selected.append(message)
+    selected.reverse()
+    return selected
+
+def format_chat_history_for_llm(chat_history: Sequence[Dict[str, str]], new_message: str) -> List[types.Content]:
+    """Format recent chat history and the new message into alternating Gemini conversation turns"""
     try:
-        conversation = "You are a helpful AI assistant. Please provide clear, concise, and friendly responses. Keep your responses conversational and not too lengthy since they will be converted to speech.\n\n"
-        
-        if chat_history:
-            conversation += "Previous conversation:\n"
-            for message in chat_history[-6:]:
-                if message["role"] == "user":
-                    conversation += f"User: {message['content']}\n"
-                else:
-                    conversation += f"Assistant: {message['content']}\n"
-            conversation += "\n"
-        
-        conversation += f"User: {new_message}\n\nAssistant:"
-        return conversation
+        turns = [(GEMINI_ROLES.get(message["role"], "model"), message["content"]) for message in select_recent_messages(chat_history)]
     except Exception as e:
-        logger.error(f"Failed to format chat history: {e}")
-        return f"User: {new_message}\n\nAssistant:"
+        logger.error("Failed to format chat history: %s", e)
+        turns = []
+    turns.append(("user", new_message))
+    
+    # Gemini expects the conversation to open with the user and alternate roles, so merge
+    # consecutive same-role messages and drop assistant turns cut off at the window start
+    contents: List[types.Content] = []
+    for role, text in turns:
+        if contents and contents[-1].role == role:
+            contents[-1].parts.append(types.Part(text=text))
+        elif contents or role == "user":
+            contents.append(types.Content(role=role, parts=[types.Part(text=text)]))
+    return contents
 
-def generate_llm_response(chat_history: List[Dict[str, str]], new_message: str, max_retries: int = 2) -> Tuple[bool, str, str]:
+async def generate_llm_response(chat_history: Sequence[Dict[str, str]], new_message: str, max_retries: int = 2, use_cache: bool = True) -> Tuple[bool, str, str]:
     """Generate LLM response with retry logic and error handling"""
+    if not new_message.strip():
+        logger.warning("Empty message, skipping Gemini request")
+        return False, FALLBACK_RESPONSES["llm_error"], "empty_input"
+    
     try:
-        client = genai.Client()
+        client = get_genai_client()
     except Exception as e:
-        logger.error(f"Failed to initialize Gemini client: {e}")
+        logger.error("Failed to initialize Gemini client: %s", e)
         return False, FALLBACK_RESPONSES["api_unavailable"], "api_unavailable"
     
-    prompt = format_chat_history_for_llm(chat_history, new_message)
+    contents = format_chat_history_for_llm(chat_history, new_message)
+    cache_key = llm_cache_key(contents)
+    cached_response = llm_cache.get(cache_key) if use_cache else None
+    if cached_response:
+        logger.info("LLM cache hit, skipping Gemini request")
+        return True, cached_response, "success"
     
-    for attempt in range(max_retries + 1):
-        try:
-            logger.info(f"LLM generation attempt {attempt + 1}")
-            
-            llm_response = client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)
-                ),
-            )
-            
-            ai_response = llm_response.text.strip()
-            
-            if not ai_response:
-                logger.warning("Empty LLM response")
+    if not gemini_circuit.allow():
+        logger.warning("Gemini circuit open, skipping LLM request")
+        return False, FALLBACK_RESPONSES["api_unavailable"], "api_unavailable"
+    
+    try:
+        async with gemini_bulkhead:
+            for attempt in range(max_retries + 1):
+                retry_after = None
+                try:
+                    logger.info("LLM generation attempt %s", attempt + 1)
+                    
+                    llm_response = await client.aio.models.generate_content(
+                        model=GEMINI_MODEL,
+                        contents=contents,
+                        config=GENERATION_CONFIG,
+                    )
+                    
+                    ai_response = llm_response.text.strip()
+                    
+                    if ai_response:
+                        logger.info("LLM response generated successfully")
+                        gemini_circuit.record_success()
+                        if use_cache:
+                            llm_cache.set(cache_key, ai_response)
+                        return True, ai_response, "success"
+                    logger.warning("Empty LLM response")
+                    
+                except errors.APIError as e:
+                    logger.error("LLM generation attempt %s failed: %s", attempt + 1, e)
+                    if not is_retryable_status(e.code):
+                        # Gemini is reachable but rejected the request; retrying will not help
+                        gemini_circuit.record_success()
+                        return False, FALLBACK_RESPONSES["llm_error"], "llm_error"
+                    response_headers = getattr(e.response, "headers", None) or {}
+                    retry_after = retry_after_delay(response_headers.get("Retry-After"))
+                except Exception as e:
+                    logger.error("LLM generation attempt %s failed: %s", attempt + 1, e)
+                
                 if attempt < max_retries:
-                    continue
-                return False, FALLBACK_RESPONSES["llm_error"], "llm_error"
-            
-            logger.info(f"LLM response generated successfully")
-            return True, ai_response, "success"
-            
-        except Exception as e:
-            logger.error(f"LLM generation attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries:
-                continue
-            return False, FALLBACK_RESPONSES["llm_error"], "llm_error"
+                    await asyncio.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+    except BulkheadFullError as e:
+        logger.warning("%s, rejecting LLM request", e)
+        return False, FALLBACK_RESPONSES["api_unavailable"], "api_unavailable"
     
-    return False, FALLBACK_RESPONSES["llm_error"], "llm_error"
\ No newline at end of file
+    gemini_circuit.record_failure()
+    return False, FALLBACK_RESPONSES["llm_error"], "llm_error"
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Upstream HTTP statuses worth retrying; auth and validation errors are not
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+def is_retryable_status(status_code: int) -> bool:
+    """Check whether an upstream HTTP status indicates a transient failure"""
+    return status_code in RETRYABLE_STATUS_CODES
+
+def backoff_delay(attempt: int, base: float = 0.2, cap: float = 5.0) -> float:
+    """Exponential backoff with full jitter for the given zero-based attempt"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def retry_after_delay(retry_after: Optional[str], cap: float = 10.0) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date, capped so a request never stalls for long"""
+    if not retry_after:
+        return None
+    try:
+        delay = float(retry_after)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), cap)
+
+class CircuitBreaker:
+    """Per-provider circuit breaker that fails fast while an upstream is down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, fail_threshold: int = 5, recovery_window: float = 30.0):
+        self.name = name
+        self.fail_threshold = fail_threshold
+        self.recovery_window = recovery_window
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted, letting one trial through per recovery window"""
+        if self.state != self.CLOSED and time.monotonic() - self._opened_at >= self.recovery_window:
+            self.state = self.HALF_OPEN
+            self._opened_at = time.monotonic()
+            logger.info("Circuit %s half-open, allowing a trial call", self.name)
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        if self.state != self.CLOSED:
+            logger.info("Circuit %s closed", self.name)
+        self.state = self.CLOSED
+        self._failures = 0
+
+    def record_failure(self):
+        """Count a failed call and open the circuit once the threshold is reached"""
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.fail_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit %s opened after %s failures", self.name, self._failures)
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+class BulkheadFullError(Exception):
+    """Raised when a bulkhead has no free slot and its wait queue is full"""
+
+class Bulkhead:
+    """Caps in-flight calls to a provider and rejects callers beyond a bounded queue"""
+
+    def __init__(self, name: str, max_concurrent: int = 16, queue_depth: int = 8):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.queue_depth = queue_depth
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._waiting = 0
+
+    async def __aenter__(self):
+        if self._semaphore.locked() and self._waiting >= self.queue_depth:
+            raise BulkheadFullError(f"Bulkhead {self.name} is full")
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+
+class RateLimiter:
+    """Token bucket that queues callers once a provider's request budget is spent"""
+
+    def __init__(self, name: str, max_calls: int, period: float):
+        self.name = name
+        self.capacity = max_calls
+        self.rate = max_calls / period
+        self._tokens = float(max_calls)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request may be sent, then consume one token"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                logger.info("Rate limit reached for %s, delaying request", self.name)
+                await asyncio.sleep((1 - self._tokens) / self.rate)
@@ -1,7 +1,10 @@
+import asyncio
 import logging
 import assemblyai as aai
-from fastapi import UploadFile
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import BinaryIO, Tuple
+from services.reliability import Bulkhead, BulkheadFullError, CircuitBreaker, RateLimiter, backoff_delay, is_retryable_status
 
 logger = logging.getLogger(__name__)
 
@@ -11,41 +14,83 @@ FALLBACK_RESPONSES = {
     "api_unavailable": "Some of my services are temporarily unavailable. I apologize for the inconvenience."
 }
 
-def transcribe_audio(audio_file: UploadFile, api_key: str, max_retries: int = 2) -> Tuple[bool, str, str]:
+# Reliability guards shared by every AssemblyAI call in this process
+assemblyai_circuit = CircuitBreaker("assemblyai")
+assemblyai_bulkhead = Bulkhead("assemblyai")
+# AssemblyAI allows 20,000 requests per 5 minutes; queue locally instead of drawing 429s
+assemblyai_rate_limiter = RateLimiter("assemblyai", max_calls=20_000, period=300)
+
+# Threads for the blocking AssemblyAI SDK, kept apart from the loop's default executor.
+# They only wait on the network, so there is one per transcription the bulkhead admits
+asr_pool = ThreadPoolExecutor(max_workers=assemblyai_bulkhead.max_concurrent, thread_name_prefix="asr")
+
+def close_stt_pool():
+    """Stop the ASR threads, dropping any transcription work that has not started"""
+    asr_pool.shutdown(wait=False, cancel_futures=True)
+
+@lru_cache(maxsize=4)
+def get_transcriber(api_key: str) -> aai.Transcriber:
+    """Create one AssemblyAI transcriber per API key and reuse its HTTP client across requests"""
+    return aai.Transcriber(client=aai.Client(settings=aai.Settings(api_key=api_key)))
+
+async def transcribe_audio(audio_stream: BinaryIO, api_key: str, max_retries: int = 2) -> Tuple[bool, str, str]:
     """Transcribe audio with retry logic and error handling"""
     if not api_key:
         logger.error("AssemblyAI API key not configured")
         return False, FALLBACK_RESPONSES["api_unavailable"], "api_unavailable"
     
-    aai.settings.api_key = api_key
+    if not assemblyai_circuit.allow():
+        logger.warning("AssemblyAI circuit open, skipping transcription")
+        return False, FALLBACK_RESPONSES["api_unavailable"], "api_unavailable"
+    
+    transcriber = get_transcriber(api_key)
+    upload_url = None
+    loop = asyncio.get_running_loop()
     
-    for attempt in range(max_retries + 1):
-        try:
-            logger.info(f"Transcription attempt {attempt + 1}")
-            transcriber = aai.Transcriber()
-            
-            # Reset file pointer
-            audio_file.file.seek(0)
-            
-            transcript = transcriber.transcribe(audio_file.file)
-            
-            if transcript.status == aai.TranscriptStatus.error:
-                logger.error(f"AssemblyAI transcription error: {transcript.error}")
+    try:
+        async with assemblyai_bulkhead:
+            for attempt in range(max_retries + 1):
+                try:
+                    logger.info("Transcription attempt %s", attempt + 1)
+                    
+                    # Upload the file object once from its start, so retries only resubmit the transcription job
+                    if upload_url is None:
+                        await assemblyai_rate_limiter.acquire()
+                        audio_stream.seek(0)
+                        upload_url = await loop.run_in_executor(asr_pool, transcriber.upload_file, audio_stream)
+                    
+                    await assemblyai_rate_limiter.acquire()
+                    transcript = await loop.run_in_executor(asr_pool, transcriber.transcribe, upload_url)
+                    
+                    # AssemblyAI answered, so the service is healthy even if this audio was rejected
+                    assemblyai_circuit.record_success()
+                    
+                    if transcript.status == aai.TranscriptStatus.error:
+                        logger.error("AssemblyAI transcription error: %s", transcript.error)
+                        return False, FALLBACK_RESPONSES["stt_error"], "stt_error"
+                    
+                    if not transcript.text or transcript.text.strip() == "":
+                        logger.warning("Empty transcription result")
+                        return False, "No speech detected in the audio file", "empty_transcription"
+                    
+                    logger.info("Transcription successful: %.50s...", transcript.text)
+                    return True, transcript.text, "success"
+                    
+                except aai.types.AssemblyAIError as e:
+                    logger.error("Transcription attempt %s failed: %s", attempt + 1, e)
+                    status_code = getattr(e, "status_code", None)
+                    if status_code is not None and not is_retryable_status(status_code):
+                        # AssemblyAI is reachable but rejected the request; retrying will not help
+                        assemblyai_circuit.record_success()
+                        return False, FALLBACK_RESPONSES["stt_error"], "stt_error"
+                except Exception as e:
+                    logger.error("Transcription attempt %s failed: %s", attempt + 1, e)
+                
                 if attempt < max_retries:
-                    continue
-                return False, FALLBACK_RESPONSES["stt_error"], "stt_error"
-            
-            if not transcript.text or transcript.text.strip() == "":
-                logger.warning("Empty transcription result")
-                return False, "No speech detected in the audio file", "empty_transcription"
-            
-            logger.info(f"Transcription successful: {transcript.text[:50]}...")
-            return True, transcript.text, "success"
-            
-        except Exception as e:
-            logger.error(f"Transcription attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries:
-                continue
-            return False, FALLBACK_RESPONSES["stt_error"], "stt_error"
+                    await asyncio.sleep(backoff_delay(attempt))
+    except BulkheadFullError as e:
+        logger.warning("%s, rejecting transcription", e)
+        return False, FALLBACK_RESPONSES["api_unavailable"], "api_unavailable"
     
-    return False, FALLBACK_RESPONSES["stt_error"], "stt_error"
\ No newline at end of file
+    assemblyai_circuit.record_failure()
+    return False, FALLBACK_RESPONSES["stt_error"], "stt_error"
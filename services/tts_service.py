@@ -1,6 +1,11 @@
-import requests
+import asyncio
+import hashlib
+import httpx
 import logging
-from typing import Optional, Tuple
+import orjson
+from typing import Dict, Optional, Tuple
+from services.cache import TTLCache
+from services.reliability import Bulkhead, BulkheadFullError, CircuitBreaker, backoff_delay, is_retryable_status, retry_after_delay
 
 logger = logging.getLogger(__name__)
 
@@ -10,43 +15,125 @@ FALLBACK_RESPONSES = {
     "api_unavailable": "Some of my services are temporarily unavailable. I apologize for the inconvenience."
 }
 
-def generate_tts(text: str, api_key: str, voice_id: str = "en-US-natalie", max_retries: int = 2) -> Tuple[bool, Optional[str], str]:
-    """Generate TTS with retry logic and error handling"""
+# Murf speech generation endpoint, relative to the shared client's base URL
+MURF_TTS_PATH = "/v1/speech/generate"
+
+# Shared Murf client so TTS calls reuse pooled keep-alive connections; idle
+# connections are kept long enough to survive transcription and the LLM call.
+# HTTP/2 is negotiated when Murf offers it, letting concurrent calls share one connection
+murf_client = httpx.AsyncClient(
+    base_url="https://api.murf.ai",
+    http2=True,
+    timeout=30,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+)
+
+# Reliability guards shared by every Murf call in this process
+murf_circuit = CircuitBreaker("murf")
+murf_bulkhead = Bulkhead("murf")
+
+# Maximum number of generated audio URLs kept for repeated (voice_id, text) requests
+TTS_CACHE_SIZE = 1024
+
+# Seconds a cached audio URL is reused; Murf's hosted audio files expire after a while
+TTS_CACHE_TTL = 3600
+
+# Audio URLs from earlier successful TTS calls, keyed by a digest of (voice_id, text)
+tts_cache = TTLCache(maxsize=TTS_CACHE_SIZE, ttl=TTS_CACHE_TTL)
+
+# TTS requests currently in flight, so identical concurrent requests share one Murf call
+tts_in_flight: Dict[bytes, asyncio.Task] = {}
+
+def tts_cache_key(voice_id: str, text: str) -> bytes:
+    """Build a compact cache key for a voice and text pair"""
+    return hashlib.blake2b(f"{voice_id}\0{text}".encode(), digest_size=16).digest()
+
+async def generate_tts(text: str, api_key: str, voice_id: str = "en-US-natalie", max_retries: int = 2) -> Tuple[bool, Optional[str], str]:
+    """Generate TTS, reusing cached or in-flight results for identical requests"""
+    if not text.strip():
+        logger.warning("Empty text, skipping Murf request")
+        return False, None, "empty_text"
+    
     if not api_key:
         logger.error("Murf API key not configured")
         return False, None, "api_unavailable"
     
-    for attempt in range(max_retries + 1):
-        try:
-            logger.info(f"TTS generation attempt {attempt + 1}")
-            
-            url = "https://api.murf.ai/v1/speech/generate"
-            payload = {"text": text, "voice_id": voice_id}
-            headers = {"content-type": "application/json", "api-key": api_key}
-            
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                audio_url = response.json().get("audioFile")
-                if audio_url:
-                    logger.info("TTS generation successful")
-                    return True, audio_url, "success"
-                else:
-                    logger.error("Audio URL not found in Murf response")
-                    if attempt < max_retries:
-                        continue
-            else:
-                logger.error(f"Murf API error: {response.status_code}, {response.text}")
+    cache_key = tts_cache_key(voice_id, text)
+    cached_url = tts_cache.get(cache_key)
+    if cached_url:
+        logger.info("TTS cache hit, skipping Murf request")
+        return True, cached_url, "success"
+    
+    task = tts_in_flight.get(cache_key)
+    if task is None:
+        task = asyncio.create_task(request_tts(text, api_key, voice_id, max_retries))
+        tts_in_flight[cache_key] = task
+        task.add_done_callback(lambda _: tts_in_flight.pop(cache_key, None))
+    else:
+        logger.info("Identical TTS request in flight, waiting for its result")
+    
+    # Shield the shared call so one disconnected caller does not cancel it for the others
+    success, audio_url, error_type = await asyncio.shield(task)
+    if success:
+        tts_cache.set(cache_key, audio_url)
+    return success, audio_url, error_type
+
+async def request_tts(text: str, api_key: str, voice_id: str, max_retries: int) -> Tuple[bool, Optional[str], str]:
+    """Call Murf with retry logic and error handling"""
+    if not murf_circuit.allow():
+        logger.warning("Murf circuit open, skipping TTS request")
+        return False, None, "api_unavailable"
+    
+    payload = {"text": text, "voice_id": voice_id}
+    headers = {"api-key": api_key}
+    
+    try:
+        async with murf_bulkhead:
+            for attempt in range(max_retries + 1):
+                retry_after = None
+                try:
+                    logger.info("TTS generation attempt %s", attempt + 1)
+                    
+                    response = await murf_client.post(MURF_TTS_PATH, json=payload, headers=headers)
+                    logger.debug("Murf responded over %s", response.http_version)
+                    
+                    if response.status_code == 200:
+                        audio_url = orjson.loads(response.content).get("audioFile")
+                        if audio_url:
+                            logger.info("TTS generation successful")
+                            murf_circuit.record_success()
+                            return True, audio_url, "success"
+                        logger.error("Audio URL not found in Murf response")
+                    elif is_retryable_status(response.status_code):
+                        logger.error("Murf API error: %s, %s", response.status_code, response.text)
+                        retry_after = retry_after_delay(response.headers.get("Retry-After"))
+                    else:
+                        # Murf is reachable but rejected the request; retrying will not help
+                        logger.error("Murf API rejected request: %s, %s", response.status_code, response.text)
+                        murf_circuit.record_success()
+                        return False, None, "tts_error"
+                    
+                except httpx.TimeoutException:
+                    logger.error("TTS request timeout on attempt %s", attempt + 1)
+                except Exception as e:
+                    logger.error("TTS generation attempt %s failed: %s", attempt + 1, e)
+                
                 if attempt < max_retries:
-                    continue
-            
-        except requests.exceptions.Timeout:
-            logger.error(f"TTS request timeout on attempt {attempt + 1}")
-            if attempt < max_retries:
-                continue
-        except Exception as e:
-            logger.error(f"TTS generation attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries:
-                continue
+                    await asyncio.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+    except BulkheadFullError as e:
+        logger.warning("%s, rejecting TTS request", e)
+        return False, None, "api_unavailable"
     
-    return False, None, "tts_error"
\ No newline at end of file
+    murf_circuit.record_failure()
+    return False, None, "tts_error"
+
+async def warm_up_tts_connection():
+    """Open a pooled Murf connection ahead of a TTS request, ignoring any errors"""
+    try:
+        await murf_client.head("/")
+    except Exception as e:
+        logger.debug("Murf connection warm-up failed: %s", e)
+
+async def close_tts_client():
+    """Close the shared Murf client's pooled connections"""
+    await murf_client.aclose()